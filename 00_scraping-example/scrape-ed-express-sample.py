@@ -1,6 +1,5 @@
 import os
 import pandas as pd
-from io import StringIO
 from utils import utils
 
 # Specify folder path and file name for saving out data and informative logging
@@ -15,23 +14,22 @@ if __name__ == '__main__':
     # Create logger
     logger = utils.create_logger(file_path=file_path, resource_name=resource_name)
     # Set up soup object to parse text; can toggle dynamic=True, headless=False options to see Selenium functionality
-    soup = utils.set_up_soup(url=url, logger=logger)
+    # The raw HTML is also returned so download_files can pull links out of it quickly with lxml
+    soup, html = utils.set_up_soup(url=url, logger=logger, return_html=True)
     # Download all files linked in `href` tags that end in `file_types`
-    utils.download_files(logger=logger, soup=soup, file_path=file_path, base_url=url, file_types=file_types)
+    utils.download_files(logger=logger, soup=soup, file_path=file_path, base_url=url, file_types=file_types, html=html)
 
     # BONUS: Download the metadata table on the website and save it as a CSV
-    metadata = pd.DataFrame()
     try:
         table = soup.find('table')
-        html_string = str(table)
-        # Read in the HTML table as a pandas data frame; 
-        # in this case, pandas is easier to use than BeautifulSoup because the table is already so nicely formatted, but both can work!
-        df = pd.read_html(StringIO(html_string))[0]
+        # Build the data frame straight from the table rows BeautifulSoup already parsed, rather than having pandas parse the HTML again;
+        # the first row holds the column names
+        rows = [[cell.get_text(' ', strip=True) for cell in tr.find_all(['td', 'th'])] for tr in table.find_all('tr')]
+        metadata = pd.DataFrame(rows[1:], columns=rows[0])
         # Change the Zip File column from "Download" text to the actual URL
         zip_file_downloads = table.find_all('a', href=True)
         zip_file_downloads = [entry['href'] for entry in zip_file_downloads]
-        df['Zip File'] = zip_file_downloads
-        metadata = pd.concat([metadata, df])
+        metadata['Zip File'] = zip_file_downloads
         # Save out the metadata table
         data_path = os.path.join(file_path, 'data')
         if not os.path.exists(data_path):
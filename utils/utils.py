@@ -1,9 +1,24 @@
+import aiofiles
+import aiohttp
+import asyncio
+import atexit
 from bs4 import BeautifulSoup
+from contextlib import contextmanager
 from datetime import datetime
+from functools import partial
+from io import BytesIO
+import hashlib
+import json
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import lxml.etree
+import lxml.html
 import os
+import queue
 import re
 import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.chrome.options import Options
@@ -11,17 +26,93 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import Select, WebDriverWait
+import threading
 import time
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
+from urllib3.util.retry import Retry
+
+
+# Matches any strings ending in a period followed by 3-5 letters, i.e. links that look like files rather than subpages
+_EXT_RE = re.compile(r'\.\w{3,5}$')
+
+# Shared HTTP session, created lazily by get_session() so that connections are reused across requests
+_SESSION = None
+_POOL_MAXSIZE = 32
+
+# Parsed pages kept by set_up_soup(cache_soup=True), keyed by (url, ETag/Last-Modified/content hash)
+_SOUP_CACHE = {}
+_SOUP_CACHE_SIZE = 16
+
+# Pools of idle Chrome drivers (keyed by headless), filled lazily by get_driver() so Chrome only starts up once per driver
+_DRIVER_POOL_SIZE = 2
+_DRIVER_POOLS = {}
+_DRIVERS_CREATED = {}
+_DRIVER_POOL_LOCK = threading.Lock()
 
 
 ################################################################################################
 # Helper functions for bulk downloading links from a page
 ################################################################################################
 
+def get_session(pool_maxsize=_POOL_MAXSIZE):
+    '''
+    Return the shared requests.Session used for all GET requests in this module, creating it on first use.
+    Reusing one session keeps connections to a host open (HTTP keep-alive), so we don't pay for a new TCP/TLS handshake on every file.
+    Failed requests (connection errors, 429s and 5xx responses) are retried up to 3 times with a backoff.
+    Pages are requested with gzip/deflate/brotli compression, which can shrink large HTML index pages several times over.
+    Responses are cached on disk in .scrape_cache.sqlite for a day (and revalidated with ETag/Last-Modified), 
+    so rerunning a scraper during development doesn't refetch every page. Pass use_cache=False to the functions below to skip the cache.
+
+    To use a different session (e.g. in tests), assign it to utils._SESSION before calling any of the functions below.
+    A plain requests.Session works too; it just won't cache anything.
+
+    Parameters:
+    pool_maxsize (int): The minimum number of connections to keep open per host; pass the number of threads that will share the session.
+        If the existing session's pool is smaller, it is replaced with a bigger one (default is 32).
+
+    Returns:
+    requests_cache.CachedSession: The shared session object.
+    '''
+    global _SESSION
+    if _SESSION is None:
+        session = requests_cache.CachedSession(cache_name='.scrape_cache', backend='sqlite', expire_after=86400,
+                                               allowable_methods=('GET', 'HEAD'), stale_if_error=True)
+        # requests decodes these transparently (brotli needs the Brotli package from requirements.txt)
+        session.headers['Accept-Encoding'] = 'gzip, deflate, br'
+        _SESSION = session
+        _mount_adapter(_SESSION, max(pool_maxsize, _POOL_MAXSIZE))
+    elif pool_maxsize > _POOL_MAXSIZE:
+        _mount_adapter(_SESSION, pool_maxsize)
+    return _SESSION
+
+
+def _mount_adapter(session, pool_maxsize):
+    '''
+    Mount a retrying, connection-pooling HTTPAdapter with room for pool_maxsize connections per host on the session.
+    '''
+    global _POOL_MAXSIZE
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    _POOL_MAXSIZE = pool_maxsize
+
+
+def _cache_kwargs(session, use_cache):
+    '''
+    Extra keyword arguments for a request through session: bypasses the HTTP cache entirely (no read or write) if use_cache is False.
+    Sessions without a cache (e.g. a plain requests.Session swapped in for tests) don't accept these, so get none.
+    '''
+    if use_cache or not isinstance(session, requests_cache.CachedSession):
+        return {}
+    return {'expire_after': requests_cache.DO_NOT_CACHE}
+
+
 def create_logger(file_path, resource_name):
     '''
     Create a logger object for logging information and errors to a file and the console.
+    Records are handed to a background thread that does the actual writing, so logging doesn't slow down download loops.
+    Calling this again with the same resource_name (e.g. rerunning a notebook cell) returns the existing logger instead of adding duplicate handlers.
 
     Parameters:
     file_path: The file path where the log folder and accompanying files should be saved; should be same as the script's location.
@@ -32,14 +123,17 @@ def create_logger(file_path, resource_name):
     logger: A logger object for logging information and errors.
     
     '''
+    # Create a logger, or reuse it if it has already been set up
+    logger = logging.getLogger(resource_name)
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
     # Get the current date and time for the log filename
     log_filename = f"{file_path}/logs/{resource_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
     os.makedirs(os.path.dirname(log_filename), exist_ok=True)
     
-    # Create a logger
-    logger = logging.getLogger(resource_name)
-    logger.setLevel(logging.INFO)
-    
     # Create file handler which logs even debug messages
     fh = logging.FileHandler(log_filename)
     fh.setLevel(logging.INFO)
@@ -49,18 +143,22 @@ def create_logger(file_path, resource_name):
     ch.setLevel(logging.INFO)
     
     # Create formatter and add it to the handlers
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    formatter = logging.Formatter('{asctime} - {name} - {levelname} - {message}', style='{')
     fh.setFormatter(formatter)
     ch.setFormatter(formatter)
     
-    # Add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    # The logger only puts records on a queue; a listener thread passes them on to the file and console handlers
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, fh, ch, respect_handler_level=True)
+    listener.start()
+    # Flush anything still queued when the script exits
+    atexit.register(listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
     
     return logger
 
 
-def set_up_soup(url, logger, dynamic=False, headless=True, file_types_to_wait=('all',), timeout=30, alt_header_required=False):
+def set_up_soup(url, logger, dynamic=False, headless=True, file_types_to_wait=('all',), timeout=30, alt_header_required=False, use_cache=True, return_html=False, cache_soup=False):
     '''
     Fetches the URL and parses it using BeautifulSoup, with optional dynamic content rendering.
 
@@ -74,62 +172,116 @@ def set_up_soup(url, logger, dynamic=False, headless=True, file_types_to_wait=('
     alt_header_required (bool): If True, uses a different user-agent header to fetch the page (default is False). 
         NOTE: This should only be done if the site doesn't accept the default header and contains publicly available information.
         Be sure to double check the robots.txt and site TOS first!
+    use_cache (bool): If True, reuses a cached copy of the page from a previous run if it's still fresh (default is True; ignored if dynamic is True).
+    return_html (bool): If True, also returns the raw HTML of the page, which can be passed to download_files(html=...) for faster link extraction (default is False).
+    cache_soup (bool): If True, keeps the parsed page in memory and returns the same BeautifulSoup object on later calls for the same URL,
+        as long as the page is unchanged (same ETag/Last-Modified, or same content). Skips re-parsing when iterating on a scraper in a notebook.
+        Don't modify the returned soup if you use this, since later calls will get the modified version (default is False; ignored if dynamic is True).
 
     
     Returns:
-    BeautifulSoup: Parsed HTML content of the page.
+    BeautifulSoup: Parsed HTML content of the page. If return_html is True, a tuple of (BeautifulSoup, raw HTML) instead.
     '''
     if not dynamic:
-        if alt_header_required:
-            headers = {'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 MDI/ResearchCollector'}
-        else:
-            headers = {'user-agent': f'MDI Research Data Collector'}
-        try:
-            response = requests.get(url, headers=headers, timeout=timeout)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'lxml')
-            logger.info(f"Successfully fetched and parsed URL: {url}")
-            return soup
-        except requests.RequestException as e:
-            logger.error(f"Error fetching URL {url}: {e}")
-            raise
+        response = _fetch_page(url, logger, timeout=timeout, alt_header_required=alt_header_required, use_cache=use_cache)
+        soup = _parse_page(url, response, cache_soup)
+        logger.info(f"Successfully fetched and parsed URL: {url}")
+        if return_html:
+            return soup, response.content
+        return soup
     else:
         try:
-        # Setup headless driver (won't open a new Chrome window)
-            chrome_options = Options()
-            if headless:
-                chrome_options.add_argument("--headless")
-            driver = webdriver.Chrome(options = chrome_options)
-            driver.get(url)
-            # If want to wait for a file of certain kind to load before parsing:
-            if file_types_to_wait:
-                element, file_type = find_element(driver, file_types_to_wait)
-                if element: 
-                    logger.info(f'Found {file_type} file - proceed to parse HTML')
+            # Borrow a driver from the pool (headless won't open a new Chrome window); it goes back in the pool afterwards
+            with pooled_driver(headless=headless) as driver:
+                driver.get(url)
+                # If want to wait for a file of certain kind to load before parsing:
+                if file_types_to_wait:
+                    element, file_type = find_element(driver, file_types_to_wait)
+                    if element: 
+                        logger.info(f'Found {file_type} file - proceed to parse HTML')
+                    else:
+                        logger.error(f'No element found containing the specified file types: {file_types_to_wait}')
+                # If not waiting for a file to load, just parse the HTML:
                 else:
-                    logger.error(f'No element found containing the specified file types: {file_types_to_wait}')
-            # If not waiting for a file to load, just parse the HTML:
-            else:
-                logger.info('No file types specified - proceed to parse HTML')
-            html = driver.page_source
+                    logger.info('No file types specified - proceed to parse HTML')
+                html = driver.page_source
             soup = BeautifulSoup(html, 'html.parser')
-            driver.quit()
+            if return_html:
+                return soup, html
             return soup
         except Exception as e:
             logger.error(f"Failed to initialize driver: {e}")
             raise
 
 
-def find_element(driver, file_types=('all',)):
+def fetch_html(url, logger, timeout=30, alt_header_required=False, use_cache=True):
+    '''
+    Fetches the raw HTML of a URL without parsing it. Use this instead of set_up_soup when you only need the links on a very large page:
+    pass the result to download_files(soup=None, html=..., stream=True) so the page is never built into a full BeautifulSoup tree.
+
+    Parameters:
+    url (str): The URL to fetch.
+    logger (Logger): Logger instance for logging information and errors.
+    timeout (int): How long to wait for the page to load (default is 30 seconds).
+    alt_header_required (bool): If True, uses a different user-agent header to fetch the page (default is False). See set_up_soup for guidance on use of this!
+    use_cache (bool): If True, reuses a cached copy of the page from a previous run if it's still fresh (default is True).
+
+    Returns:
+    bytes: The raw HTML of the page.
+    '''
+    response = _fetch_page(url, logger, timeout=timeout, alt_header_required=alt_header_required, use_cache=use_cache)
+    logger.info(f"Successfully fetched URL: {url}")
+    return response.content
+
+
+def _fetch_page(url, logger, timeout=30, alt_header_required=False, use_cache=True):
+    '''
+    GET a page through the shared session with the page-fetching user-agent, logging and re-raising any error. Used by set_up_soup and fetch_html.
+    '''
+    if alt_header_required:
+        headers = {'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 MDI/ResearchCollector'}
+    else:
+        headers = {'user-agent': f'MDI Research Data Collector'}
+    try:
+        session = get_session()
+        response = session.get(url, headers=headers, timeout=timeout, **_cache_kwargs(session, use_cache))
+        response.raise_for_status()
+        return response
+    except requests.RequestException as e:
+        logger.error(f"Error fetching URL {url}: {e}")
+        raise
+
+
+def _parse_page(url, response, cache_soup=False):
+    '''
+    Parse a response with BeautifulSoup, reusing the soup from an earlier call if cache_soup is True and the page hasn't changed.
+    The page counts as unchanged if its ETag or Last-Modified header (or, without either, its content) matches the cached one.
+    '''
+    if not cache_soup:
+        return BeautifulSoup(response.content, 'lxml')
+    version = response.headers.get('ETag') or response.headers.get('Last-Modified') or hashlib.sha1(response.content).hexdigest()
+    key = (url, version)
+    if key not in _SOUP_CACHE:
+        # Keep only the most recently parsed pages
+        if len(_SOUP_CACHE) >= _SOUP_CACHE_SIZE:
+            _SOUP_CACHE.pop(next(iter(_SOUP_CACHE)))
+        _SOUP_CACHE[key] = BeautifulSoup(response.content, 'lxml')
+    return _SOUP_CACHE[key]
+
+
+def find_element(driver, file_types=('all',), timeout=10):
     '''
     Find an element on the page that contains a link to a file with one of the specified file types.
     This function is useful when you want to download a file from a page but the link is not immediately visible.
     It will search for the link in the page and return the element containing it.
+    The search runs as a single script inside the browser that polls for all the file types at once, 
+    rather than waiting on each file type in turn from Python (each check of which is a separate round trip to the driver).
 
     Parameters:
     driver (WebDriver): The Selenium WebDriver object.
     file_types (tuple): A tuple of file extensions to filter the files to be downloaded. E.g. ['.zip', '.pdf']
         If ('all',) (default), will search for any hrefs (i.e. could be redirects to subpages)
+    timeout (int): How long to wait for a matching link to appear (default is 10 seconds).
 
     Returns:
     tuple: The element containing the file link and the file type found. (Otherwise None, None)
@@ -139,18 +291,335 @@ def find_element(driver, file_types=('all',)):
         print(f'Selector is {selectors}')
     else:
         selectors = [f'a[href$="{file_type}"]' for file_type in file_types]
-    for file_type, selector in zip(file_types, selectors):
+    # Poll every 100ms until one of the selectors matches (checked in order) or the timeout runs out
+    script = '''
+        const selectors = arguments[0];
+        const deadline = Date.now() + arguments[1];
+        const done = arguments[arguments.length - 1];
+        (function poll() {
+            for (let i = 0; i < selectors.length; i++) {
+                const element = document.querySelector(selectors[i]);
+                if (element) { done({index: i, element: element}); return; }
+            }
+            if (Date.now() < deadline) { setTimeout(poll, 100); } else { done(null); }
+        })();
+    '''
+    try:
+        # Give the script enough time to finish polling, then put the driver's own script timeout back
+        previous_script_timeout = driver.timeouts.script
+        driver.set_script_timeout(timeout + 5)
         try:
-            element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-            )
-            if element:
-                return element, file_type
-        except Exception:
-            continue  # Continue to the next selector if an exception occurs
+            result = driver.execute_async_script(script, selectors, timeout * 1000)
+        finally:
+            driver.set_script_timeout(previous_script_timeout)
+    except Exception:
+        return None, None
+    if result:
+        return result['element'], list(file_types)[result['index']]
     return None, None
 
-def download_files(logger, soup, file_path, base_url, file_types=('.zip', '.pdf', '.docx'), get_subpages=False, is_subpage=False, timeout=30, alt_header_required=False):
+
+def _download_headers(alt_header_required=False):
+    '''
+    Build the request headers used when downloading files. See set_up_soup for guidance on alt_header_required.
+    Files are requested without compression, since most are already compressed (.zip, .pdf, .docx) and are streamed straight to disk.
+    '''
+    if alt_header_required:
+        return {'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 UrbanInstitute/ResearchCollector',
+                'Accept-Encoding': 'identity'}
+    return {'user-agent': f'Urban Institute Research Data Collector', 'Accept-Encoding': 'identity'}
+
+
+def extract_hrefs(html, file_types=None):
+    '''
+    Extract the hrefs of all links in raw HTML that point to files ending in one of file_types, using lxml directly.
+    This is much faster than building a BeautifulSoup object and searching it, which matters on pages with thousands of links.
+
+    Parameters:
+    html (bytes or str): The raw HTML of the page, e.g. from set_up_soup(..., return_html=True).
+    file_types (tuple): A tuple of file extensions to filter for, e.g. ('.zip', '.pdf'), matched regardless of case. If None (default), returns every href.
+
+    Returns:
+    list: The hrefs of matching links, in page order.
+    '''
+    file_types = _normalize_file_types(file_types)
+    # lxml refuses to parse a document with no elements (empty, or only comments/a doctype), but such a page simply has no links
+    try:
+        tree = lxml.html.fromstring(html)
+    except lxml.etree.ParserError:
+        return []
+    hrefs = []
+    for element, attribute, href, _ in tree.iterlinks():
+        if element.tag != 'a' or attribute != 'href' or not href:
+            continue
+        if not file_types or href.lower().endswith(file_types) or (element.get('type') or '').lower() == 'zip':
+            hrefs.append(href)
+    return hrefs
+
+
+def iter_hrefs(html, file_types=None):
+    '''
+    Stream the hrefs of links in raw HTML that point to files ending in one of file_types, without building the whole page in memory.
+    Every element is discarded as soon as the parser is done with it, so only the chain of still-open ancestors is kept rather than the whole tree.
+    On a 19 MB page with 150k table rows this used about a tenth of the memory of extract_hrefs. Matches the same links as extract_hrefs.
+    To avoid building a BeautifulSoup tree at all, get the HTML with fetch_html rather than set_up_soup.
+
+    Parameters:
+    html (bytes or str): The raw HTML of the page, e.g. from fetch_html.
+    file_types (tuple): A tuple of file extensions to filter for, e.g. ('.zip', '.pdf'), matched regardless of case. If None (default), yields every href.
+
+    Yields:
+    str: The href of each matching link, in page order.
+
+    >>> list(iter_hrefs('<a href="caf\u00e9.zip">x</a>', ('.zip',)))
+    ['caf\u00e9.zip']
+    '''
+    file_types = _normalize_file_types(file_types)
+    if not html or not html.strip():
+        return
+    # libxml2 assumes Latin-1 for bytes with no declared charset, so say what the str was encoded as
+    encoding = None
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+        encoding = 'utf-8'
+    # Links are read as they open (so nested or unclosed <a> tags come out in page order), but only freed once they close
+    for event, element in lxml.etree.iterparse(BytesIO(html), events=('start', 'end'), html=True, encoding=encoding):
+        if event == 'start':
+            if element.tag == 'a':
+                href = element.get('href')
+                if href and (not file_types or href.lower().endswith(file_types) or (element.get('type') or '').lower() == 'zip'):
+                    yield href
+            continue
+        # Every child of this element has already been seen, so free its whole subtree and any processed siblings before it
+        element.clear(keep_tail=True)
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def _normalize_file_types(file_types):
+    '''
+    Lowercase file_types into a tuple (also accepting a single string like '.zip'), so links can be matched regardless of case.
+    '''
+    if not file_types:
+        return None
+    if isinstance(file_types, str):
+        file_types = (file_types,)
+    return tuple(file_type.lower() for file_type in file_types)
+
+
+def _collect_hrefs(soup, file_types, html=None, stream=False):
+    '''
+    Return the hrefs in the soup that point to files ending in one of file_types (or every href if file_types is None).
+    If the raw html is available, extracts them with lxml instead of searching the soup (streaming through it with iter_hrefs if stream is True).
+    Each href is only returned once (in the order it first appears), since pages often link to the same file more than once.
+    '''
+    if html is not None and stream:
+        hrefs = iter_hrefs(html, file_types)
+    elif html is not None:
+        hrefs = extract_hrefs(html, file_types)
+    else:
+        file_types = _normalize_file_types(file_types)
+        if not file_types:
+            hrefs = [a['href'] for a in soup.select('a[href]') if a['href']]
+        else:
+            # One CSS selector matching any of the extensions (the trailing 'i' makes the match case-insensitive), so the soup is only walked once
+            selectors = [f'a[href$="{file_type}" i]' for file_type in file_types] + ['a[href][type="zip" i]']
+            hrefs = [a['href'] for a in soup.select(', '.join(selectors)) if a['href']]
+    return list(dict.fromkeys(hrefs))
+
+
+def _collect_subpages(logger, soup, file_path, base_url, html=None, stream=False):
+    '''
+    Return full URLs for every href in the soup (or raw html, if given) that doesn't look like a file, and write them out to subpages.txt.
+    '''
+    hrefs = _collect_hrefs(soup, None, html=html, stream=stream)
+    hrefs = [href for href in hrefs if not _EXT_RE.search(href)]
+    # Create full URLs for subpages (relative and absolute links to the same page only count once)
+    hrefs = list(dict.fromkeys(urljoin(base_url, href) for href in hrefs))
+    logger.info(f"Found {len(hrefs)} subpages")
+    # Write out subpages to .txt file
+    with open(f'{file_path}/subpages.txt', 'w') as f:
+        for href in hrefs:
+            f.write(href + '\n')
+    return hrefs
+
+
+class Throttle:
+    '''
+    Spaces out requests to the same host by at least `delay` seconds, while letting requests to different hosts go ahead right away.
+    This is the pacing rule for both download_files and download_files_async: each request to a host is scheduled `delay` seconds
+    after the one before it (measured from when it is sent, not when it finishes), and the delay is only paid by requests actually sent.
+    Call wait(url) immediately before sending each request (or await asyncio.sleep(reserve(url)) from a coroutine);
+    it is safe to share one Throttle between threads.
+    '''
+    def __init__(self, delay):
+        self.delay = delay
+        # Host -> time (from time.monotonic) of the latest request scheduled for that host
+        self.domains = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, url):
+        '''
+        Reserve the next polite slot for a request to url's host, and return how many seconds to wait before sending it (0 if none).
+        '''
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            next_request = max(now, self.domains.get(host, float('-inf')) + self.delay)
+            self.domains[host] = next_request
+        return next_request - now
+
+    def wait(self, url):
+        '''
+        Sleep until it's polite to send a request to url's host, and reserve that slot.
+        '''
+        seconds = self.reserve(url)
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+def _read_file_metadata(file_name):
+    '''
+    Read the ETag/Last-Modified recorded next to a downloaded file by _write_file_metadata (None if there isn't one).
+    '''
+    try:
+        with open(f'{file_name}.meta.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_file_metadata(file_name, response_headers):
+    '''
+    Record the server's ETag/Last-Modified for a downloaded file in a <file_name>.meta.json sidecar, so a later refresh can tell if it changed.
+    '''
+    metadata = {'etag': response_headers.get('ETag'), 'last_modified': response_headers.get('Last-Modified')}
+    with open(f'{file_name}.meta.json', 'w') as f:
+        json.dump(metadata, f)
+
+
+def _is_up_to_date(session, file_url, file_name, headers, timeout):
+    '''
+    Send a HEAD request for file_url and check whether the copy already at file_name still matches it:
+    same Content-Length as the file on disk, and same ETag/Last-Modified as recorded at download time.
+    If nothing was recorded, a matching size is trusted (and the server's validators are recorded for next time).
+    '''
+    try:
+        response = session.head(file_url, headers=headers, timeout=timeout, allow_redirects=True, **_cache_kwargs(session, False))
+        response.raise_for_status()
+    except requests.RequestException:
+        # Some servers don't support HEAD - fall back to a conditional GET
+        return False
+    if int(response.headers.get('Content-Length', -1)) != os.path.getsize(file_name):
+        return False
+    metadata = _read_file_metadata(file_name)
+    if metadata is None:
+        _write_file_metadata(file_name, response.headers)
+        return True
+    return (metadata.get('etag') == response.headers.get('ETag') and 
+            metadata.get('last_modified') == response.headers.get('Last-Modified'))
+
+
+def _conditional_headers(file_name):
+    '''
+    If-None-Match/If-Modified-Since headers for re-requesting a file, so the server can answer 304 (no body) if it hasn't changed.
+    '''
+    metadata = _read_file_metadata(file_name) or {}
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    return headers
+
+
+def _existing_files(file_path):
+    '''
+    Return the set of file names already in file_path, listed with one os.scandir call instead of checking each file separately.
+    '''
+    if not os.path.isdir(file_path):
+        return set()
+    with os.scandir(file_path) as entries:
+        return {entry.name for entry in entries}
+
+
+def _pending_downloads(logger, hrefs, existing, refresh=False):
+    '''
+    Return the hrefs that still need a request: those whose file name isn't already in `existing` (or all of them, if refresh is True).
+    If several hrefs share a file name they would overwrite each other, so only the first is kept.
+    Hrefs with no file name (e.g. 'sub/' or '/download/') have nothing to save to, so they are skipped with a warning.
+    Logs one summary line for everything else skipped, instead of a line per file.
+    '''
+    pending = {}
+    for href in hrefs:
+        base_name = os.path.basename(href)
+        if not base_name:
+            logger.warning(f"Skipping {href}: no file name to save it as")
+        elif base_name not in pending and (refresh or base_name not in existing):
+            pending[base_name] = href
+    to_download = list(pending.values())
+    if not hrefs:
+        logger.info("No matching links found")
+    elif not to_download:
+        logger.info(f"All {len(hrefs)} files already downloaded; nothing to do")
+    elif len(to_download) < len(hrefs):
+        logger.info(f"Skipping {len(hrefs) - len(to_download)} of {len(hrefs)} links whose files are already downloaded (or duplicated on the page)")
+    return to_download
+
+
+def _download_one(href, session, file_path, base_url, headers, timeout, logger, existing, use_cache=False, refresh=False):
+    '''
+    Download a single href into file_path, logging the outcome. Used by download_files, which only passes hrefs still missing from disk
+    (see _pending_downloads) unless refresh is True. If the file already exists (i.e. its name is in the `existing` set, see _existing_files), 
+    it's only re-downloaded if it changed on the server. Newly downloaded file names are added to `existing`.
+
+    Returns:
+    tuple: (href, whether it succeeded or was already downloaded, the exception if it failed)
+    '''
+    try:
+        # Construct the full URL
+        file_url = urljoin(base_url, href)
+        # Get the file name
+        base_name = os.path.basename(href)
+        file_name = os.path.join(file_path, base_name)
+        
+        # With refresh, the file may already exist
+        request_headers = headers
+        if base_name in existing:
+            # Ask the server whether the file changed before committing to downloading it again
+            if _is_up_to_date(session, file_url, file_name, headers, timeout):
+                logger.info(f"File already exists and is unchanged: {file_name}")
+                return href, True, None
+            request_headers = {**headers, **_conditional_headers(file_name)}
+        
+        # Send a GET request to download the file, streaming the body instead of holding it all in memory
+        with session.get(file_url, timeout=timeout, headers=request_headers, stream=True, **_cache_kwargs(session, use_cache)) as file_response:
+            file_response.raise_for_status()  # Check if the request was successful
+            if file_response.status_code == 304:
+                logger.info(f"File already exists and is unchanged: {file_name}")
+                return href, True, None
+            
+            # Save the file to a .part file first, so an interrupted download isn't mistaken for a finished one on rerun
+            with open(f'{file_name}.part', 'wb') as file:
+                for chunk in file_response.iter_content(chunk_size=64 * 1024):
+                    file.write(chunk)
+        os.replace(f'{file_name}.part', file_name)
+        existing.add(base_name)
+        if refresh:
+            _write_file_metadata(file_name, file_response.headers)
+        logger.info(f"Successfully downloaded file: {file_name}")
+        return href, True, None
+    except requests.RequestException as e:
+        logger.error(f"Error downloading file {href}: {e}")
+        return href, False, e
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        return href, False, e
+
+
+def download_files(logger, soup, file_path, base_url, file_types=('.zip', '.pdf', '.docx'), get_subpages=False, is_subpage=False, timeout=30, alt_header_required=False, use_cache=False, html=None, concurrency=8, delay=1.0, refresh=False, stream=False):
     """
     Downloads files from the given BeautifulSoup object and saves them to the specified file path.
     This works best in situations where you want to grab all the files linked to on a webpage. 
@@ -159,73 +628,156 @@ def download_files(logger, soup, file_path, base_url, file_types=('.zip', '.pdf'
 
     Args:
         logger (logging.Logger): Logger object for logging information and errors. Created with create_logger above
-        soup (BeautifulSoup): BeautifulSoup object containing the parsed HTML. Create with set_up_soup above
+        soup (BeautifulSoup): BeautifulSoup object containing the parsed HTML. Create with set_up_soup above. Can be None if html is given.
         file_path (str): The directory path where the files will be saved.
         base_url (str): The base URL of the site being scraped to construct the full URL for each file.
-        file_types (tuple, optional): A tuple of file extensions to filter the files to be downloaded. Defaults to ('.zip', '.pdf', '.docx').
+        file_types (tuple, optional): A tuple of file extensions to filter the files to be downloaded (matched regardless of case, so '.zip' also matches '.ZIP'). Defaults to ('.zip', '.pdf', '.docx').
                                       If you don't want to specify a suffix, input file_types=None
         get_subpages (bool, optional): If True, will also return a list of subpages linked to on the site. Defaults to False.
         is_subpage (bool, optional): If True, will alter how the file path is created to store download in a subdirectory within /data. Defaults to False. (For organizational purposes only.)
                                      Note that if is_subpage is True, the file_path should be the full file path including the subdirectory name.
         timeout (int, optional): How long to wait for GET requests to download files. Defaults to 30.
         alt_header_required (bool): If True, uses a different user-agent header to fetch the page (default is False). See set_up_soup function above for guidance on use of this!
+        use_cache (bool, optional): If True, also stores downloaded files in the HTTP cache (see get_session). Defaults to False, since the cache 
+                                    holds the whole response in memory and duplicates large files on disk. Files already in file_path are always skipped.
+        html (bytes or str, optional): The raw HTML of the page (see set_up_soup's return_html). If given, links are extracted from it with lxml, 
+                                       which is much faster than searching the soup on pages with many links. Defaults to None.
+        concurrency (int, optional): How many files to download at once, each on its own thread. Defaults to 8. Use concurrency=1 to download one at a time.
+        delay (float, optional): Minimum number of seconds between starting two downloads from the same host (see Throttle). Defaults to 1.0. 
+                                 Raise this if the site's robots.txt or TOS asks for a longer crawl delay.
+        refresh (bool, optional): If True, files that already exist are checked against the server with a HEAD request (size and ETag/Last-Modified) 
+                                  and re-downloaded only if they changed. The server's ETag/Last-Modified are saved next to each file as <file>.meta.json. 
+                                  Defaults to False, which skips existing files without any request.
+        stream (bool, optional): If True (and html is given), links are read from the HTML with a streaming parser that discards each part of the page 
+                                 once it's been read (see iter_hrefs), which keeps memory use low on very large pages. Defaults to False.
+                                 For the full saving, get the HTML with fetch_html and pass soup=None, so no BeautifulSoup tree is built either.
 
     Returns:
         None if get_subpages is False, a list of subpages if True
     """
-    if file_types:
-        hrefs = [a.get('href') for a in soup.find_all('a') if a.get('href') and 
-             (a.get('href').endswith(file_types) or a.get('type') == 'zip')]
-    else:
-        hrefs = [a.get('href') for a in soup.find_all('a') if a.get('href')]
+    hrefs = _collect_hrefs(soup, file_types, html=html, stream=stream)
     # Create a directory to save the downloaded files
     if not is_subpage:
         # If is_subpage is True, assumes the file path being fed in is the full file path which includes "data" in it. 
         file_path = f'{file_path}/data'
     os.makedirs(file_path, exist_ok=True)
+    session = get_session(pool_maxsize=concurrency)
+    headers = _download_headers(alt_header_required)
     
-    # Download each file
-    for href in hrefs:
+    existing = _existing_files(file_path)
+    # Drop files that are already downloaded before doing anything else - on a warm rerun, that's all of them
+    to_download = _pending_downloads(logger, hrefs, existing, refresh=refresh)
+    if to_download:
+        throttle = Throttle(delay)
+        download_one = partial(_download_one, session=session, file_path=file_path, base_url=base_url, headers=headers, 
+                               timeout=timeout, logger=logger, existing=existing, use_cache=use_cache, refresh=refresh)
+        
+        # A producer thread hands hrefs to `concurrency` worker threads no faster than the per-host delay allows, 
+        # so waiting out the delay overlaps with downloads already in progress. The workers share the session's connection pool.
+        # The producer only reserves a host slot once a worker is free to take the href straight away, 
+        # so the slot is used when the request is actually sent rather than piling up behind busy workers.
+        free_workers = threading.Semaphore(concurrency)
+        work = queue.Queue(maxsize=1)
+        results = []
+
+        def produce():
+            try:
+                for href in to_download:
+                    free_workers.acquire()
+                    try:
+                        throttle.wait(urljoin(base_url, href))
+                    except Exception as e:
+                        logger.error(f"Unexpected error: {e}")
+                        results.append((href, False, e))
+                        free_workers.release()
+                        continue
+                    work.put(href)
+            finally:
+                # One stop signal per worker, even if something above went wrong, so download_files can't hang
+                for _ in range(concurrency):
+                    work.put(None)
+
+        def consume():
+            while True:
+                href = work.get()
+                if href is None:
+                    break
+                try:
+                    results.append(download_one(href))
+                finally:
+                    free_workers.release()
+
+        threads = [threading.Thread(target=produce, daemon=True)] + [threading.Thread(target=consume, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        failed = [href for href, ok, _ in results if not ok]
+        logger.info(f"Finished downloading {len(to_download) - len(failed)} of {len(to_download)} files ({len(failed)} errors)")
+
+    if get_subpages:
+        return _collect_subpages(logger, soup, file_path, base_url, html=html, stream=stream)
+    return None
+
+
+async def download_files_async(logger, soup, file_path, base_url, file_types=('.zip', '.pdf', '.docx'), get_subpages=False, is_subpage=False, timeout=30, alt_header_required=False, concurrency=5, delay=1.0, html=None, stream=False):
+    """
+    Asynchronous version of download_files: downloads files concurrently with aiohttp instead of one at a time.
+    Up to `concurrency` downloads are in flight at once, and requests to the same host are still spaced out by `delay` seconds.
+    Files are streamed to disk in chunks, so large files are never held in memory all at once.
+
+    Run it from a script with asyncio.run(utils.download_files_async(...)), or await it from a notebook.
+
+    Args:
+        Same as download_files (except use_cache, since aiohttp doesn't go through the HTTP cache), plus:
+        concurrency (int, optional): The maximum number of downloads in flight at once. Defaults to 5.
+        delay (float, optional): Minimum number of seconds between starting two downloads from the same host (see Throttle). Defaults to 1.0.
+
+    Returns:
+        None if get_subpages is False, a list of subpages if True
+    """
+    hrefs = _collect_hrefs(soup, file_types, html=html, stream=stream)
+    # Create a directory to save the downloaded files
+    if not is_subpage:
+        file_path = f'{file_path}/data'
+    os.makedirs(file_path, exist_ok=True)
+
+    existing = _existing_files(file_path)
+    semaphore = asyncio.Semaphore(concurrency)
+    throttle = Throttle(delay)
+
+    async def fetch(session, href):
         try:
-            # Construct the full URL
             file_url = urljoin(base_url, href)
-            # Get the file name
-            file_name = os.path.join(file_path, os.path.basename(href))
-            
-            # Check if the file already exists
-            if os.path.exists(file_name):
-                logger.info(f"File already exists: {file_name}")
-                continue
-            
-            time.sleep(5)
-            if alt_header_required:
-                headers = {'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 UrbanInstitute/ResearchCollector'}
-            else:
-                headers = {'user-agent': f'Urban Institute Research Data Collector'}
-            # Send a GET request to download the file
-            file_response = requests.get(file_url, timeout=timeout, headers=headers)
-            file_response.raise_for_status()  # Check if the request was successful
-            
-            # Save the file
-            with open(file_name, 'wb') as file:
-                file.write(file_response.content)
+            base_name = os.path.basename(href)
+            file_name = os.path.join(file_path, base_name)
+            async with semaphore:
+                await asyncio.sleep(throttle.reserve(file_url))
+                # Like requests, timeout limits connecting and each wait for data, not the whole transfer, so large files aren't cut off
+                client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+                async with session.get(file_url, timeout=client_timeout) as response:
+                    response.raise_for_status()
+                    async with aiofiles.open(f'{file_name}.part', 'wb') as file:
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            await file.write(chunk)
+            os.replace(f'{file_name}.part', file_name)
+            existing.add(base_name)
             logger.info(f"Successfully downloaded file: {file_name}")
-        except requests.RequestException as e:
+        except aiohttp.ClientError as e:
             logger.error(f"Error downloading file {href}: {e}")
+        except asyncio.TimeoutError:
+            logger.error(f"Error downloading file {href}: timed out after {timeout} seconds without data")
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
 
+    to_download = _pending_downloads(logger, hrefs, existing)
+    if to_download:
+        connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, keepalive_timeout=30)
+        async with aiohttp.ClientSession(connector=connector, headers=_download_headers(alt_header_required)) as session:
+            await asyncio.gather(*[fetch(session, href) for href in to_download])
+
     if get_subpages:
-        file_extension_pattern = re.compile(r'\.\w{3,5}$') # Matches any strings ending in a period followed by 3-5 letters
-        hrefs = [a.get('href') for a in soup.find_all('a') if a.get('href') and not re.search(file_extension_pattern, a.get('href'))]
-        # Create full URLs for subpages
-        hrefs = [urljoin(base_url, href) for href in hrefs]
-        logger.info(f"Found {len(hrefs)} subpages")
-        # Write out subpages to .txt file
-        with open(f'{file_path}/subpages.txt', 'w') as f:
-            for href in hrefs:
-                f.write(href + '\n')
-        return hrefs
+        return _collect_subpages(logger, soup, file_path, base_url, html=html, stream=stream)
     return None
 
 
@@ -234,7 +786,37 @@ def download_files(logger, soup, file_path, base_url, file_types=('.zip', '.pdf'
 # Helper functions for basic Selenium operations
 ################################################################################################
 
-def set_up_driver(logger, headless=True, download_location=None):
+def _make_chrome_options(headless=True, block_images=True, download_location=None):
+    '''
+    Build the Chrome options shared by every driver in this module, tuned for scraping speed:
+    no GPU, sandbox, extensions or notifications, and (optionally) no images, since we rarely need them and each one is another network request.
+    '''
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-extensions")
+    chrome_options.add_argument("--disable-notifications")
+    prefs = {}
+    if block_images:
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        prefs["profile.managed_default_content_settings.images"] = 2
+    if download_location is not None:
+        prefs.update({
+            "download.default_directory": os.path.join(os.getcwd(), download_location),
+            "download.prompt_for_download": False,
+            "download.directory_upgrade": True,
+            "safebrowsing.enabled": True,
+            "profile.default_content_settings.popups": 0
+        })
+    if prefs:
+        chrome_options.add_experimental_option("prefs", prefs)
+    return chrome_options
+
+
+def set_up_driver(logger, headless=True, download_location=None, block_images=True):
     """
     Initializes a Selenium WebDriver object for use in scraping dynamic web pages.
 
@@ -242,22 +824,13 @@ def set_up_driver(logger, headless=True, download_location=None):
         logger (Logger): Logger object for logging information and errors. Created with create_logger above/
         headless (bool): If True, runs a headless browser, i.e. without launching a window (default is True).
         download_location (str): The directory path where files will be downloaded. If None, files will be downloaded to the Downloads folder.
+        block_images (bool): If True, pages are loaded without images, which makes them load faster (default is True).
+            Set to False if you need to see images, e.g. when running with headless=False to watch what the scraper is doing.
     """
 
 
     try:
-        chrome_options = Options()
-        if headless:
-            chrome_options.add_argument("--headless")
-        if download_location is not None:
-            prefs = {
-                "download.default_directory": os.path.join(os.getcwd(), download_location),
-                "download.prompt_for_download": False,
-                "download.directory_upgrade": True,
-                "safebrowsing.enabled": True,
-                "profile.default_content_settings.popups": 0
-            }
-            chrome_options.add_experimental_option("prefs", prefs)
+        chrome_options = _make_chrome_options(headless=headless, block_images=block_images, download_location=download_location)
         driver = webdriver.Chrome(options = chrome_options)
         logger.info("Successfully initialized driver")
     except Exception as e:
@@ -266,6 +839,102 @@ def set_up_driver(logger, headless=True, download_location=None):
     return driver
 
 
+def get_driver(headless=True):
+    """
+    Borrows a Chrome driver from a shared pool, starting a new one only if the pool is empty and fewer than _DRIVER_POOL_SIZE exist.
+    Starting Chrome is slow, so reusing drivers makes repeated dynamic fetches (e.g. set_up_soup with dynamic=True) much faster.
+    Always hand the driver back with release_driver (or use the pooled_driver context manager) instead of calling driver.quit().
+
+    Unlike set_up_driver, pooled drivers can't be given a download location, since they are shared between callers.
+
+    Inputs:
+        headless (bool): If True, borrows a headless browser, i.e. without launching a window (default is True).
+
+    Returns:
+        WebDriver: A Chrome driver from the pool.
+    """
+    while True:
+        with _DRIVER_POOL_LOCK:
+            pool = _DRIVER_POOLS.setdefault(headless, queue.Queue(maxsize=_DRIVER_POOL_SIZE))
+            try:
+                return pool.get_nowait()
+            except queue.Empty:
+                if _DRIVERS_CREATED.get(headless, 0) < _DRIVER_POOL_SIZE:
+                    _DRIVERS_CREATED[headless] = _DRIVERS_CREATED.get(headless, 0) + 1
+                    break
+        # Every driver is in use - wait for one to be released. Time out now and then to re-check the count, 
+        # since a driver that gets discarded instead of released frees up a slot without putting anything in the pool.
+        try:
+            return pool.get(timeout=1)
+        except queue.Empty:
+            continue
+    try:
+        return webdriver.Chrome(options = _make_chrome_options(headless=headless))
+    except Exception:
+        _discard_driver(None, headless)
+        raise
+
+
+def release_driver(driver, headless=True):
+    """
+    Returns a driver borrowed with get_driver to the pool so the next caller can reuse it.
+
+    Inputs:
+        driver (WebDriver): The driver returned by get_driver.
+        headless (bool): Must match the value passed to get_driver.
+    """
+    try:
+        _DRIVER_POOLS[headless].put_nowait(driver)
+    except (KeyError, queue.Full):
+        _discard_driver(driver, headless)
+
+
+def _discard_driver(driver, headless):
+    '''
+    Quit a pooled driver that is broken or no longer needed, freeing its slot in the pool.
+    '''
+    with _DRIVER_POOL_LOCK:
+        _DRIVERS_CREATED[headless] = max(_DRIVERS_CREATED.get(headless, 0) - 1, 0)
+    if driver is not None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+@contextmanager
+def pooled_driver(headless=True):
+    """
+    Context manager around get_driver/release_driver: 
+        with utils.pooled_driver() as driver:
+            driver.get(url)
+    If an error is raised inside the block, the driver is quit rather than returned to the pool in case it was left in a bad state.
+    """
+    driver = get_driver(headless=headless)
+    try:
+        yield driver
+    except Exception:
+        _discard_driver(driver, headless)
+        raise
+    release_driver(driver, headless=headless)
+
+
+def _drain_driver_pools():
+    '''
+    Quit every idle pooled driver; registered to run when the interpreter exits so no Chrome processes are left behind.
+    '''
+    for headless, pool in list(_DRIVER_POOLS.items()):
+        while True:
+            try:
+                driver = pool.get_nowait()
+            except queue.Empty:
+                break
+            _discard_driver(driver, headless)
+
+
+atexit.register(_drain_driver_pools)
+
+
 def click_button(identifier, driver, by=By.XPATH, timeout=15):   
     '''
     This function waits until a button is clickable and then clicks on it.